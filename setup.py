@@ -14,6 +14,15 @@ setup(
         # 'boto3',
         'requests',
         'earthaccess',
+        'tqdm',
     ],
+    extras_require={
+        'zarr': [
+            'zarr>=3.0',
+            'numcodecs>=0.14',
+            'xarray>=2025.1.0',
+            'rioxarray>=0.18',
+        ],
+    },
     python_requires='>=3.6',
 )
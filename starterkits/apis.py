@@ -7,7 +7,8 @@ import requests
 import math
 import earthaccess
 from osgeo import gdal
-from .utils import handle_exceptions, mask_raster_with_geometry, unzip_file, merge_rasters, authenticate_nasa_earth
+from .auth import authenticate_nasa_earth
+from .utils import handle_exceptions, mask_raster_with_geometry, unzip_file, merge_rasters
 
 elevation_datasets = {
     'NASA': {
@@ -162,7 +163,7 @@ def get_wind_data(country, height):
     """
     os.makedirs(f'Data/{country}/Wind speed', exist_ok=True)
     download_file(f'https://globalwindatlas.info/api/gis/country/{country}/wind-speed/{height}', f'Data/{country}/Wind speed/{country}_wind_speed_{height}.tif', 'Wind speed')
-    mask_raster_with_geometry(f'Data/{country}/Wind speed/{country}_wind_speed_{height}.tif', f'Data/{country}/Boundaries/{country}_adm_0.gpkg', f'Data/{country}/Wind speed/{country}_wind_speed_{height}.tif')
+    mask_raster_with_geometry(f'Data/{country}/Wind speed/{country}_wind_speed_{height}.tif', f'Data/{country}/Boundaries/{country}_adm_0.gpkg', f'Data/{country}/Wind speed/{country}_wind_speed_{height}.tif', overview_resampling='average')
 
 @handle_exceptions
 def get_solar_data(country):
@@ -240,7 +241,7 @@ def get_dem_data(country, database='Nasa Earth', nasa_username=None, nasa_passwo
                 download_file(p_url, p_path, f'Elevation Part {i+1}')
                 part_paths.append(p_path)
             
-            merge_rasters(part_paths, output_path)
+            merge_rasters(part_paths, output_path, method='gdal')
             
             # Cleanup
             for p in part_paths:
@@ -266,15 +267,15 @@ def get_dem_data(country, database='Nasa Earth', nasa_username=None, nasa_passwo
         downloaded_paths = earthaccess.download(results, f'Data/{country}/Elevation/{dem_type}')
 
         part_paths = [str(p) for p in downloaded_paths]
-        merge_rasters(part_paths, output_path)
+        # Mask straight from the virtual mosaic, so the tiles are only read once
+        vrt_path = merge_rasters(part_paths, output_path)
+        mask_raster_with_geometry(vrt_path, f'Data/{country}/Boundaries/{country}_adm_0.gpkg', output_path, overview_resampling='average')
             
         # Cleanup
-        for p in part_paths:
+        for p in part_paths + [vrt_path]:
             if os.path.exists(p):
                 os.remove(p)
 
-        mask_raster_with_geometry(output_path, f'Data/{country}/Boundaries/{country}_adm_0.gpkg', output_path)
-
 
         print(f"Downloaded Elevation data to Data/{country}/Elevation/{dem_type}")
     else:
@@ -432,7 +433,8 @@ def get_traveltime_data(country):
 
     mask_raster_with_geometry(f'Data/{country}/Traveltime/{country}_traveltime.tif', 
                               boundaries, 
-                              f'Data/{country}/Traveltime/{country}_traveltime.tif')
+                              f'Data/{country}/Traveltime/{country}_traveltime.tif',
+                              overview_resampling='average')
 
 
 @handle_exceptions
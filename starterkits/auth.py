@@ -0,0 +1,41 @@
+import os
+from pathlib import Path
+import earthaccess
+
+def authenticate_nasa_earth(username=None, password=None):
+    """
+    Authenticate with NASA Earthdata through earthaccess.
+
+    Args:
+        username (str): Earthdata username.
+        password (str): Earthdata password.
+
+    Returns:
+        bool: True if the login succeeded, False otherwise.
+    """
+    if not (username and password):
+        print('No username or password provided for Nasa Earthaccess, the landcover and elevation data will be skiped.')
+        return False
+
+    # Create the .netrc file that earthaccess/GDAL/curl look for
+    netrc_path = Path.home() / ".netrc"
+    netrc_content = f"machine urs.earthdata.nasa.gov login {username} password {password}\n"
+    # Create the file with proper permissions, so the password is never world-readable
+    fd = os.open(netrc_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(netrc_content)
+    except BaseException:
+        # Don't leave a partial .netrc behind
+        if netrc_path.exists():
+            netrc_path.unlink()
+        raise
+    # Tighten an already existing file, os.open only applies the mode on creation
+    os.chmod(netrc_path, 0o600)
+
+    try:
+        earthaccess.login(persist=True)
+        return True
+    except Exception as e:
+        print(f"Earthdata auth failed: {e}; skipping landcover/elevation.")
+        return False
@@ -1,49 +1,155 @@
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+import functools
+import hashlib
+import logging
 import os   
-from google.colab import userdata
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm.auto import tqdm
 
 try:
+  # Credentials come from the Colab secrets when running in a notebook
+  from google.colab import userdata
   AWS_ACCESS_KEY_ID = userdata.get('AWS_ACCESS_KEY_ID')
   AWS_SECRET_ACCESS_KEY = userdata.get('AWS_SECRET_ACCESS_KEY')
 except ImportError:
   AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
   AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
 
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
 
 BUCKET_NAME = 'geospatialsdk'
+S3_WORKERS = int(os.getenv('S3_WORKERS', 30))
+S3_CHUNK_MB = int(os.getenv('S3_CHUNK_MB', 16))
+S3_CONCURRENCY = int(os.getenv('S3_CONCURRENCY', 16))
 
-s3 = boto3.client(
-    's3',
-    aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY
+MB = 1024 * 1024
+
+# Large rasters are fetched through parallel ranged GETs
+transfer_cfg = TransferConfig(
+    multipart_threshold=8 * MB,
+    multipart_chunksize=S3_CHUNK_MB * MB,
+    max_concurrency=S3_CONCURRENCY,
+    use_threads=True
 )
 
+@functools.lru_cache(maxsize=1)
+def _s3():
+  """Returns the shared S3 client, created on first use.
+
+  The connection pool is sized for every worker thread running its ranged GETs
+  at once, so connections are reused instead of paying a new TLS handshake.
+  """
+  return boto3.session.Session().client(
+      's3',
+      aws_access_key_id=AWS_ACCESS_KEY_ID,
+      aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+      config=Config(max_pool_connections=S3_WORKERS * S3_CONCURRENCY)
+  )
+
+
+def _local_etag(path):
+  """Returns the MD5 of a local file, which is the ETag of a single-part upload."""
+  md5 = hashlib.md5()
+  with open(path, 'rb') as f:
+    for chunk in iter(lambda: f.read(MB), b''):
+      md5.update(chunk)
+  return md5.hexdigest()
+
+
+def _is_up_to_date(obj, rel_path):
+  """Checks whether the local file already matches the listed S3 object.
+
+  Uses the ``Size``, ``ETag`` and ``LastModified`` returned by
+  ``list_objects_v2``, so no extra request is sent.
+  """
+  if not os.path.exists(rel_path):
+    return False
+  if obj['Size'] != os.path.getsize(rel_path):
+    return False
+  etag = obj['ETag'].strip('"')
+  if '-' in etag:
+    # Multipart ETags are not a plain MD5, fall back to the modification time
+    return os.path.getmtime(rel_path) >= obj['LastModified'].timestamp()
+  return etag == _local_etag(rel_path)
+
+
+def _download_task(bucket_name, obj, rel_path):
+  """Downloads a single listed object unless the local copy is up to date.
+
+  Returns:
+    A ``(skipped, error)`` tuple, the error is returned instead of raised.
+  """
+  try:
+    if _is_up_to_date(obj, rel_path):
+      return True, None
+    _s3().download_file(bucket_name, obj['Key'], rel_path, Config=transfer_cfg)
+    return False, None
+  except Exception as e:
+    return False, e
+
+
+def _local_path(key):
+  """Returns the local path that mirrors the S3 key structure."""
+  file = key.rpartition('/')[2]
+  return os.path.join('Data', file[0:3], key)
+
 
 def download_data_from_s3(bucket_name, prefix, files):
   """Downloads all GIS data for the selected country from the S3 bucket.
 
+  Objects are downloaded concurrently using a pool of ``S3_WORKERS`` threads
+  (boto3 clients are thread-safe, so a single client is shared). The prefix
+  is listed once and the requested file names are matched against the name
+  of every key under it, at any depth. Files whose local copy already
+  matches the listed S3 object (same size and ETag) are not downloaded again.
+
   Args:
     bucket_name: The name of the S3 bucket.
     prefix: Prefix/folder path to download.
-  """
+    files: List of file names to download, or ``['All']`` for everything
+      under the prefix.
 
+  Returns:
+    A list of ``(key, error)`` tuples for the downloads that failed.
+  """
   # Use paginator to handle large number of objects
-  paginator = s3.get_paginator('list_objects_v2')
+  paginator = _s3().get_paginator('list_objects_v2')
   pages = paginator.paginate(Bucket=bucket_name, Prefix=prefix)
+  objects = [obj for page in pages for obj in page.get('Contents', [])]
+  if 'All' not in files:
+    # Files can sit in any sub-folder of the prefix, so match on the file name
+    names = set(files)
+    objects = [obj for obj in objects if obj['Key'].rpartition('/')[2] in names]
 
-  for page in pages:
-    for obj in page.get('Contents', []):
-      key = obj['Key']
-      file = key.split('/')[-1]
-      if (file in files) or ('All' in files):
-         # Extract the relative path to maintain directory structure
-        rel_path = os.path.join('Data', file[0:3], key)
-        # rel_path = rel_path.replace('Inputs/', '')
-        # Create the local directory if it doesn't exist
-        if rel_path:
-          os.makedirs(os.path.dirname(rel_path), exist_ok=True)
-        # Download the file
-        s3.download_file(bucket_name, key, rel_path)
-        print(f"Downloaded: {key} to {rel_path}")
+  # Extract the relative path to maintain directory structure
+  tasks = [(obj, _local_path(obj['Key'])) for obj in objects]
+  # Create each local directory once, before submitting to avoid races
+  for directory in {os.path.dirname(rel_path) for _, rel_path in tasks}:
+    os.makedirs(directory, exist_ok=True)
+
+  # Download the files concurrently
+  failures = []
+  skipped = 0
+  with ThreadPoolExecutor(max_workers=S3_WORKERS) as executor:
+    futures = {executor.submit(_download_task, bucket_name, obj, rel_path): obj['Key']
+               for obj, rel_path in tasks}
+    for future in tqdm(as_completed(futures), total=len(tasks), desc='Downloading'):
+      key = futures[future]
+      is_skipped, error = future.result()
+      if error is not None:
+        failures.append((key, error))
+        # Printed through tqdm so failures stay visible without logging configured
+        tqdm.write(f"Failed to download {key}: {error}")
+      elif is_skipped:
+        skipped += 1
+        logger.debug(f"Skipped {key}, the local copy is up to date")
       else:
-        continue
\ No newline at end of file
+        logger.debug(f"Downloaded {key}")
+
+  downloaded = len(tasks) - len(failures) - skipped
+  print(f"Downloaded {downloaded} of {len(tasks)} files from {bucket_name}/{prefix} "
+        f"({skipped} already up to date, {len(failures)} failed)")
+  return failures
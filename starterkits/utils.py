@@ -1,28 +1,36 @@
 import functools
+import glob
 import os
-from pathlib import Path
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+import requests
 import rasterio
-import rasterio.mask
+import rasterio.windows
+from rasterio.coords import disjoint_bounds
+from rasterio.enums import Resampling
 from rasterio.merge import merge
+from rasterio.transform import Affine, from_origin
+from rasterio.windows import Window
 import zipfile
 import geopandas as gpd
 from osgeo import gdal
-import earthaccess
-
-def authenticate_nasa_earth(username=None, password=None):
-    # Authenticate
-    if username and password:
-        # Create the .netrc file that earthaccess/GDAL/curl look for
-        netrc_content = f"machine urs.earthdata.nasa.gov login {username} password {password}\n"
-        with open(Path.home() / ".netrc", "w") as f:
-            f.write(netrc_content)
-        os.chmod(Path.home() / ".netrc", 0o600) # Set proper permissions
-        try:
-            earthaccess.login(persist=True)
-            return True
-        except:
-           print('No username or password provided for Nasa Earthaccess, the landcover and elevation data will be skiped.')
-           return False
+
+__all__ = [
+    'handle_exceptions',
+    'gdal_env',
+    'build_overviews',
+    'reproject_raster',
+    'mask_raster_with_geometry',
+    'merge_rasters',
+    'open_zarr_raster',
+    'unzip_file',
+    'get_osm_points',
+]
 
 def handle_exceptions(func):
     """
@@ -38,142 +46,437 @@ def handle_exceptions(func):
             return None
     return wrapper
 
+# GDAL cache and HTTP settings for batch processing. The block cache is capped at
+# 512 MB, as very large caches slow down merges of many small rasters
+GDAL_CACHEMAX = 512 * 1024 * 1024 # In bytes
+GDAL_ENV_OPTIONS = {
+    "GDAL_NUM_THREADS": "ALL_CPUS",
+    "VSI_CACHE": "TRUE",
+    "VSI_CACHE_SIZE": "536870912",
+    "CPL_VSIL_CURL_CHUNK_SIZE": "16777216",
+    "GDAL_HTTP_MULTIPLEX": "YES",
+    "GDAL_HTTP_VERSION": "2"
+}
+
+@contextmanager
+def gdal_env():
+    """
+    Context manager (or decorator) applying ``GDAL_CACHEMAX`` and ``GDAL_ENV_OPTIONS``
+    to both rasterio and osgeo.gdal calls, restoring the previous GDAL settings on exit.
+    """
+    # GDAL only reads the GDAL_CACHEMAX option once per process, so the cache
+    # size is set through the API instead
+    previous_cachemax = gdal.GetCacheMax()
+    previous = {key: gdal.GetConfigOption(key) for key in GDAL_ENV_OPTIONS}
+    gdal.SetCacheMax(GDAL_CACHEMAX)
+    for key, value in GDAL_ENV_OPTIONS.items():
+        gdal.SetConfigOption(key, value)
+    try:
+        # rasterio passes GDAL_CACHEMAX to GDALSetCacheMax64, which needs an int
+        with rasterio.Env(GDAL_CACHEMAX=GDAL_CACHEMAX, **GDAL_ENV_OPTIONS):
+            yield
+    finally:
+        gdal.SetCacheMax(previous_cachemax)
+        for key, value in previous.items():
+            gdal.SetConfigOption(key, value)
+
+# Tiled and compressed GeoTIFF layout, so windowed reads only decode the blocks they touch
+GTIFF_PROFILE = {
+    "tiled": True,
+    "blockxsize": 512,
+    "blockysize": 512,
+    "compress": "zstd",
+    "predictor": 2,
+    "num_threads": "all_cpus",
+    "BIGTIFF": "IF_SAFER"
+}
+GTIFF_CREATION_OPTIONS = [f"{key.upper()}={str(value).upper()}" for key, value in GTIFF_PROFILE.items()]
+OVERVIEW_LEVELS = [2, 4, 8, 16, 32]
+
+def build_overviews(raster_path, resampling='nearest'):
+    """
+    Build internal overviews of a GeoTIFF in place.
+
+    Only the levels whose overview is still at least one block wide are built,
+    so rasters that fit in a single block get no overviews.
+
+    Args:
+        raster_path (str): Path to the raster file.
+        resampling (str): Overview resampling method. Default is 'nearest', which keeps
+                          categorical data like land cover valid; use 'average' for
+                          continuous data.
+    """
+    with rasterio.open(raster_path, 'r+') as ds:
+        size = max(ds.width, ds.height)
+        levels = [factor for factor in OVERVIEW_LEVELS if size // factor >= GTIFF_PROFILE["blockxsize"]]
+        if not levels:
+            return
+        ds.build_overviews(levels, Resampling[resampling])
+        ds.update_tags(ns='rio_overview', resampling=resampling)
+
 def reproject_raster(raster_path, output_path):
     warp_options = gdal.WarpOptions(
                         format="GTiff",
                         dstSRS="EPSG:4326",
                         resampleAlg="near", # Use 'near' for categorical data like land cover
-                        creationOptions=["COMPRESS=LZW", "TILED=YES"]
+                        creationOptions=GTIFF_CREATION_OPTIONS
                     )
     
     gdal.Warp(output_path, raster_path, options=warp_options)
 
-def mask_raster_with_geometry(raster_path, shapes, output_path):
+@functools.lru_cache(maxsize=32)
+def _load_shapes(path, mtime):
+    """
+    Read a vector file once per path and modification time. The result is shared
+    between calls, so it must not be modified in place.
+    """
+    return gpd.read_file(path)
+
+@gdal_env()
+def mask_raster_with_geometry(raster_path, shapes, output_path, overview_resampling='nearest'):
     """
     Mask a raster using a list of geometries or a GeoDataFrame.
+
+    The raster is clipped in a single gdal.Warp pass using the geometries as cutline.
+    If the geometries are in a different CRS than the raster, the output is
+    reprojected to EPSG:4326.
     
     Args:
         raster_path (str): Path to the input raster file.
         shapes (list or GeoDataFrame): List of geometries or a GeoDataFrame to mask the raster.
-                                       The geometries must be in the same CRS as the raster.
-        output_path (str): Path to save the masked raster.
+                                       A list of geometries, or a GeoDataFrame without CRS, is
+                                       assumed to be in the same CRS as the raster.
+        output_path (str): Path to save the masked raster. It can be the same as ``raster_path``.
+        overview_resampling (str): Resampling method of the overviews ('nearest' or 'average').
+                                   Default is 'nearest', use 'average' for continuous data.
     """
-    reproject = False
     if isinstance(shapes, str):
-        shapes = gpd.read_file(shapes)
-        shapes = shapes.geometry.values
+        shapes = _load_shapes(shapes, os.path.getmtime(shapes))
     elif isinstance(shapes, gpd.GeoDataFrame):
-        shapes = shapes.geometry.values
-    elif isinstance(shapes, list):
         pass
+    elif isinstance(shapes, list):
+        shapes = gpd.GeoDataFrame(geometry=shapes)
     else:
         raise ValueError("shapes must be a GeoDataFrame or a path to a GeoDataFrame")
 
-    with rasterio.open(raster_path) as src:
-        if src.crs != shapes.crs:
-            reproject = True
-            shapes = shapes.to_crs(src.crs)
-        
-        out_image, out_transform = rasterio.mask.mask(src, shapes, crop=True)
-        out_meta = src.meta.copy()
+    src = gdal.Open(raster_path)
+    if src is None:
+        raise RuntimeError(f"Could not open {raster_path}: {gdal.GetLastErrorMsg()}")
+    src_crs = src.GetProjection()
+    src_nodata = src.GetRasterBand(1).GetNoDataValue()
+    src = None
 
+    if shapes.crs is None:
+        shapes = shapes.set_crs(src_crs)
+    reproject = shapes.crs != src_crs
+    if reproject:
+        shapes = shapes.to_crs(src_crs)
 
-    out_meta.update({
-        "driver": "GTiff",
-        "height": out_image.shape[1],
-        "width": out_image.shape[2],
-        "transform": out_transform
-    })
+    # The cutline goes to a real file: geopandas may write through its own bundled
+    # GDAL, whose /vsimem files are not visible to osgeo.gdal
+    cutline_dir = tempfile.mkdtemp()
+    cutline_path = os.path.join(cutline_dir, "cutline.gpkg")
 
-    with rasterio.open(output_path, "w", **out_meta) as dest:
-        dest.write(out_image)
-    
-    if reproject:
-        reproject_raster(output_path, output_path)
+    # Write to a temporary file first, as the output often replaces the input raster
+    temp_path = os.path.splitext(output_path)[0] + '_temp_mask.tif'
+    try:
+        shapes.to_file(cutline_path, driver="GPKG")
+        warp_options = gdal.WarpOptions(
+            format="GTiff",
+            cutlineDSName=cutline_path,
+            cropToCutline=True,
+            dstSRS="EPSG:4326" if reproject else None,
+            resampleAlg="near",
+            dstNodata=src_nodata,
+            creationOptions=GTIFF_CREATION_OPTIONS,
+            warpOptions=["NUM_THREADS=ALL_CPUS"],
+            multithread=True
+        )
+        ds = gdal.Warp(temp_path, raster_path, options=warp_options)
+        if ds is None:
+            raise RuntimeError(f"gdal.Warp failed to mask {raster_path}: {gdal.GetLastErrorMsg()}")
+        ds = None # Flush the raster to disk
+        os.replace(temp_path, output_path)
+    finally:
+        shutil.rmtree(cutline_dir, ignore_errors=True)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    build_overviews(output_path, resampling=overview_resampling)
     
     print(f"Masked raster saved to {output_path}")
 
-def merge_rasters(raster_paths, output_path, method='gdal'):
+MERGE_TILE_SIZE = 2048
+
+def _tile_windows(width, height, tile_size=MERGE_TILE_SIZE):
+    """
+    Split a raster grid into square windows of at most ``tile_size`` pixels.
+    """
+    return [Window(col, row, min(tile_size, width - col), min(tile_size, height - row))
+            for row in range(0, height, tile_size)
+            for col in range(0, width, tile_size)]
+
+def _merge_tile(args):
+    """
+    Merge the sources intersecting a single output window.
+
+    Runs in a worker process, so the sources are opened fresh instead of sharing
+    GDAL handles across processes.
+    """
+    source_bounds, window, transform, res, nodata = args
+    bounds = rasterio.windows.bounds(window, transform)
+    paths = [path for path, src_bounds in source_bounds if not disjoint_bounds(bounds, src_bounds)]
+    if not paths:
+        return window, None
+
+    srcs = [rasterio.open(path) for path in paths]
+    try:
+        mosaic, _ = merge(srcs, bounds=bounds, res=res, nodata=nodata)
+    finally:
+        for src in srcs:
+            src.close()
+    return window, mosaic[:, :window.height, :window.width]
+
+def _merged_tiles(tasks):
+    """
+    Yield the ``(window, mosaic)`` of every tile, merging a single tile inline
+    and otherwise using a pool of at most one process per tile.
+    """
+    if len(tasks) == 1:
+        yield _merge_tile(tasks[0])
+        return
+    with Pool(min(os.cpu_count() or 1, len(tasks))) as pool:
+        yield from pool.imap_unordered(_merge_tile, tasks)
+
+def _merge_tiled(raster_paths, output_path, output_format='gtiff'):
+    """
+    Merge rasters tile by tile in a process pool, writing either a GeoTIFF or a
+    chunked Zarr store.
+    """
+    with rasterio.open(raster_paths[0]) as src:
+        out_meta = src.meta.copy()
+        res = src.res
+        nodata = src.nodata
+
+    source_bounds = []
+    for path in raster_paths:
+        with rasterio.open(path) as src:
+            source_bounds.append((path, src.bounds))
+
+    # The output grid covers the union of all source extents
+    west = min(bounds.left for _, bounds in source_bounds)
+    south = min(bounds.bottom for _, bounds in source_bounds)
+    east = max(bounds.right for _, bounds in source_bounds)
+    north = max(bounds.top for _, bounds in source_bounds)
+    width = int(round((east - west) / res[0]))
+    height = int(round((north - south) / res[1]))
+    out_trans = from_origin(west, north, res[0], res[1])
+
+    # Tiles are merged in worker processes and written here, one window at a time.
+    # Each source is only read where it intersects a tile and no intermediate
+    # mosaics are written, so the I/O stays linear in the number of sources
+    tasks = [(source_bounds, window, out_trans, res, nodata)
+             for window in _tile_windows(width, height)]
+
+    if output_format == 'zarr':
+        import zarr
+        from zarr.codecs import BloscCodec
+
+        root = zarr.open_group(output_path, mode='w', zarr_format=3)
+        store = root.create_array(
+            'band_data',
+            shape=(out_meta['count'], height, width),
+            chunks=(1, 512, 512),
+            dtype=out_meta['dtype'],
+            fill_value=nodata,
+            compressors=BloscCodec(cname='zstd', clevel=3, shuffle='shuffle'),
+            # Dimension names let xarray open the store lazily
+            dimension_names=['band', 'y', 'x']
+        )
+        root.attrs['transform'] = list(out_trans)[:6]
+        root.attrs['crs'] = out_meta['crs'].to_wkt() if out_meta['crs'] else None
+        root.attrs['nodata'] = nodata
+
+        for window, mosaic in _merged_tiles(tasks):
+            if mosaic is not None:
+                store[:, window.row_off:window.row_off + window.height,
+                      window.col_off:window.col_off + window.width] = mosaic
+    else:
+        out_meta.update({
+            "driver": "GTiff",
+            "height": height,
+            "width": width,
+            "transform": out_trans,
+            **GTIFF_PROFILE
+        })
+
+        with rasterio.open(output_path, "w", **out_meta) as dest:
+            for window, mosaic in _merged_tiles(tasks):
+                if mosaic is not None:
+                    dest.write(mosaic, window=window)
+        build_overviews(output_path)
+
+def _copy_file(src, dst):
+    """
+    Copy ``src`` to a new ``dst`` file, never writing through an existing hard link.
+    """
+    if os.path.exists(dst):
+        os.remove(dst)
+    shutil.copyfile(src, dst)
+
+def _copy_raster(raster_path, output_path):
+    """
+    Copy a raster without decoding it, along with its sidecar files
+    (.aux.xml, .ovr, .msk and .tfw). The bytes are copied rather than hard
+    linked, so later in-place writes to the output never touch the source.
+    """
+    if os.path.abspath(raster_path) == os.path.abspath(output_path):
+        return
+    _copy_file(raster_path, output_path)
+    for sidecar in glob.glob(glob.escape(raster_path) + '.*'):
+        _copy_file(sidecar, output_path + sidecar[len(raster_path):])
+    world_file = os.path.splitext(raster_path)[0] + '.tfw'
+    if os.path.exists(world_file):
+        _copy_file(world_file, os.path.splitext(output_path)[0] + '.tfw')
+
+@gdal_env()
+def merge_rasters(raster_paths, output_path, method='vrt', output_format='gtiff'):
     """
     Merge multiple rasters into a single file.
 
+    With the default 'vrt' method no pixels are copied: a GDAL virtual mosaic is
+    written next to ``output_path`` (with a ``.vrt`` extension) and should be opened
+    directly with rasterio/GDAL. The source rasters must therefore be kept. Use
+    'gdal' or 'rasterio' to materialize the mosaic as a GeoTIFF.
+
+    For large mosaics, the 'rasterio' method can also write a chunked Zarr store
+    (with a ``.zarr`` extension), which can be read back with ``open_zarr_raster``.
+
     Args:
         raster_paths (list): List of paths to the raster files to merge.
         output_path (str): Path to save the merged raster.
-        method (str): Method to use for merging ('gdal' or 'rasterio'). Default is 'gdal'.
+        method (str): Method to use for merging ('vrt', 'gdal' or 'rasterio'). Default is 'vrt'.
+        output_format (str): Format of the 'rasterio' output ('gtiff' or 'zarr'). Default is 'gtiff'.
+
+    Returns:
+        str: Path to the merged raster.
     """
     if not raster_paths:
         return
 
-    if method == 'gdal':
+    if output_format not in ('gtiff', 'zarr'):
+        raise ValueError("Output format must be 'gtiff' or 'zarr'")
+    if output_format == 'zarr' and method != 'rasterio':
+        raise ValueError("The 'zarr' output format is only supported by the 'rasterio' method")
+
+    if method == 'vrt':
+        output_path = os.path.splitext(output_path)[0] + '.vrt'
+        print(f"Merging {len(raster_paths)} rasters into {output_path} using GDAL (VRT)")
+        vrt_options = gdal.BuildVRTOptions(resampleAlg='nearest', addAlpha=False)
+        vrt = gdal.BuildVRT(output_path, raster_paths, options=vrt_options)
+        vrt = None # Flush the VRT to disk
+    elif method == 'gdal':
         print(f"Merging {len(raster_paths)} rasters into {output_path} using GDAL (In-memory VRT)")
         vrt = gdal.BuildVRT('', raster_paths)
-        gdal.Translate(output_path, vrt)
+        gdal.Translate(output_path, vrt, creationOptions=GTIFF_CREATION_OPTIONS)
         vrt = None
         reproject_raster(output_path, output_path)
+        build_overviews(output_path)
     elif method == 'rasterio':
-        print(f"Merging {len(raster_paths)} rasters into {output_path} using Rasterio (Sequential mode)")
-        
-        # Start with the first raster
-        current_mosaic_path = raster_paths[0]
-        temp_files = []
-
-        for i in range(1, len(raster_paths)):
-            next_raster_path = raster_paths[i]
-            
-            # Define a temporary path for the intermediate merge result
-            temp_out = output_path.replace('.tif', f'_temp_merge_{i}.tif')
-            temp_files.append(temp_out)
-            
-            with rasterio.open(current_mosaic_path) as src1, rasterio.open(next_raster_path) as src2:
-                mosaic, out_trans = merge([src1, src2])
-                out_meta = src1.meta.copy()
-                out_meta.update({
-                    "driver": "GTiff",
-                    "height": mosaic.shape[1],
-                    "width": mosaic.shape[2],
-                    "transform": out_trans
-                })
-                
-                with rasterio.open(temp_out, "w", **out_meta) as dest:
-                    dest.write(mosaic)
-            
-            current_mosaic_path = temp_out
-
-        # Move the final intermediate file to the final output path
-        # OR if there was only 1 raster, just copy it/save it
-        if len(raster_paths) == 1:
-            with rasterio.open(raster_paths[0]) as src:
-                out_meta = src.meta.copy()
-                with rasterio.open(output_path, "w", **out_meta) as dest:
-                    dest.write(src.read())
+        if output_format == 'zarr':
+            output_path = os.path.splitext(output_path)[0] + '.zarr'
+        print(f"Merging {len(raster_paths)} rasters into {output_path} using Rasterio (Parallel tiles)")
+
+        if len(raster_paths) == 1 and output_format == 'gtiff':
+            _copy_raster(raster_paths[0], output_path)
         else:
-            # The last temp file is our final result
-            if os.path.exists(output_path):
-                os.remove(output_path)
-            os.rename(current_mosaic_path, output_path)
-            temp_files.remove(current_mosaic_path)
-
-        # Cleanup temporary merge files
-        for f in temp_files:
-            if os.path.exists(f):
-                os.remove(f)
-        
+            _merge_tiled(raster_paths, output_path, output_format)
+
     else:
-        raise ValueError("Method must be 'gdal' or 'rasterio'")
+        raise ValueError("Method must be 'vrt', 'gdal' or 'rasterio'")
     
     print(f"Merged rasters saved to {output_path}")
+    return output_path
+
+def open_zarr_raster(zarr_path):
+    """
+    Open a Zarr mosaic written by ``merge_rasters`` as a lazy, georeferenced
+    xarray DataArray. Requires the ``zarr`` extra (``pip install starterkits[zarr]``).
+
+    Args:
+        zarr_path (str): Path to the Zarr store.
+
+    Returns:
+        xarray.DataArray: The mosaic with ``band``, ``y`` and ``x`` coordinates.
+    """
+    import xarray as xr
+    import rioxarray  # noqa: F401, registers the .rio accessor
+
+    ds = xr.open_zarr(zarr_path, consolidated=False)
+    transform = Affine(*ds.attrs['transform'])
+    da = ds['band_data']
+    # Coordinates refer to the pixel centers
+    da = da.assign_coords(
+        band=np.arange(1, da.sizes['band'] + 1),
+        y=transform.f + transform.e * (np.arange(da.sizes['y']) + 0.5),
+        x=transform.c + transform.a * (np.arange(da.sizes['x']) + 0.5)
+    )
+    da = da.rio.write_transform(transform)
+    if ds.attrs.get('crs'):
+        da = da.rio.write_crs(ds.attrs['crs'])
+    if ds.attrs.get('nodata') is not None:
+        da = da.rio.write_nodata(ds.attrs['nodata'])
+    return da
+
+def _member_path(member, extract_to):
+    """
+    Return the sanitized path ``zipfile`` extracts a member to: drive letters,
+    absolute paths and '..' components are dropped from the member name.
+    """
+    arcname = member.filename.replace('/', os.path.sep)
+    if os.path.altsep:
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    invalid_path_parts = ('', os.path.curdir, os.path.pardir)
+    arcname = os.path.sep.join(x for x in arcname.split(os.path.sep) if x not in invalid_path_parts)
+    return os.path.join(extract_to, arcname)
+
+def _extract_members(zip_path, members, extract_to):
+    """
+    Extract a subset of archive members using a dedicated ZipFile handle,
+    as ZipFile objects are not safe for concurrent reads.
+    """
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        for member in members:
+            zip_ref.extract(member, extract_to)
 
 def unzip_file(zip_path, extract_to):
     """
     Unzip a file to a destination directory.
 
+    The members are decompressed in parallel threads (zlib releases the GIL).
+
     Args:
         zip_path (str): Path to the zip file.
         extract_to (str): Directory to extract files to.
     """
     with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        zip_ref.extractall(extract_to)
+        members = zip_ref.infolist()
+
+    # Create the directory tree upfront so the workers don't race on it. Member
+    # names are untrusted, so nothing is created outside of extract_to
+    root = os.path.realpath(extract_to)
+    for member in members:
+        target = _member_path(member, extract_to)
+        directory = target if member.is_dir() else os.path.dirname(target)
+        if os.path.commonpath([root, os.path.realpath(directory)]) == root:
+            os.makedirs(directory, exist_ok=True)
+
+    # Spread the files over the workers, largest first to balance the load
+    files = sorted((m for m in members if not m.is_dir()), key=lambda m: m.file_size, reverse=True)
+    workers = max(1, min(os.cpu_count() or 1, len(files)))
+    chunks = [files[i::workers] for i in range(workers)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda chunk: _extract_members(zip_path, chunk, extract_to), chunks))
     print(f"Extracted {zip_path} to {extract_to}")
 
 